@@ -2,21 +2,25 @@
 
 from fastapi import FastAPI, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import google.generativeai as genai
 import os
-import json
+import orjson
 from pathlib import Path
 from dotenv import load_dotenv
 from rag_system import RAGSystem
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import time
+from functools import lru_cache
 import uuid
 import uvicorn
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="AI Assistant Backend with RAG (Gemini)")
+app = FastAPI(title="AI Assistant Backend with RAG (Gemini)", default_response_class=ORJSONResponse)
 
 # Enable CORS
 app.add_middleware(
@@ -36,12 +40,141 @@ logging.basicConfig(
 logs_dir = Path("logs")
 logs_dir.mkdir(exist_ok=True)
 
+# Chat log entries are queued by the request handlers and written by a single
+# background consumer, so disk I/O never sits on the /api/chat critical path.
+LOG_QUEUE_MAXSIZE = 10_000
+LOG_FLUSH_EVERY = 100       # entries
+LOG_FLUSH_INTERVAL = 1.0    # seconds
+LOG_BUFFER_SIZE = 64 * 1024
+log_queue: asyncio.Queue = None
+log_consumer_task: asyncio.Task = None
+_LOG_STOP = object()
+
+# Local date used in log file names; recomputed only once the day rolls over
+_log_day: str = None
+_log_day_ends_at = 0.0
+
+
+def _current_log_day() -> str:
+    global _log_day, _log_day_ends_at
+    now = time.time()
+    if now >= _log_day_ends_at:
+        today = datetime.fromtimestamp(now)
+        _log_day = today.strftime("%Y-%m-%d")
+        _log_day_ends_at = datetime.combine(today.date() + timedelta(days=1), datetime.min.time()).timestamp()
+    return _log_day
+
+
+def _log_file_for(day: str) -> Path:
+    return logs_dir / f"chat_logs_{day}.jsonl"
+
+
+def _encode_log_entry(log_entry: dict) -> bytes:
+    return orjson.dumps(log_entry, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+def _write_log_entry(log_entry: dict):
+    """Synchronous fallback used when the background consumer is not running"""
+    try:
+        with open(_log_file_for(_current_log_day()), "ab") as f:
+            f.write(_encode_log_entry(log_entry))
+    except Exception as e:
+        logging.error(f"Failed to write to log file: {e}")
+
+
+def _close_log_file(f):
+    """Close a log handle, ignoring errors from flushing what is left in its buffer"""
+    try:
+        f.close()
+    except Exception as e:
+        logging.error(f"Failed to close log file: {e}")
+
+
+async def _log_consumer():
+    """
+    Drain log_queue into a buffered append-only handle, flushing every N entries or T seconds.
+    I/O errors drop the current handle (and its unflushed entries); the next entry reopens it.
+    """
+    current_day, f = None, None
+    pending = 0
+    last_flush = time.monotonic()
+    try:
+        while True:
+            timeout = max(0.0, LOG_FLUSH_INTERVAL - (time.monotonic() - last_flush))
+            try:
+                log_entry = await asyncio.wait_for(log_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                log_entry = None
+
+            if log_entry is _LOG_STOP:
+                break
+            if log_entry is not None:
+                try:
+                    day = _current_log_day()
+                    if day != current_day:
+                        if f:
+                            old, f, current_day = f, None, None
+                            old.close()
+                        f = open(_log_file_for(day), "ab", buffering=LOG_BUFFER_SIZE)
+                        current_day = day
+                    f.write(_encode_log_entry(log_entry))
+                    pending += 1
+                except Exception as e:
+                    logging.error(f"Failed to write to log file: {e}")
+                    if f:
+                        _close_log_file(f)
+                    f, current_day, pending = None, None, 0
+
+            if not pending:
+                last_flush = time.monotonic()
+            elif log_entry is None or pending >= LOG_FLUSH_EVERY:
+                try:
+                    f.flush()
+                except Exception as e:
+                    logging.error(f"Failed to flush log file: {e}")
+                    _close_log_file(f)
+                    f, current_day = None, None
+                pending = 0
+                last_flush = time.monotonic()
+    finally:
+        # Drain whatever is still queued at shutdown, after the buffered entries
+        # already in `f`, so the file stays in order
+        while log_queue is not None and not log_queue.empty():
+            log_entry = log_queue.get_nowait()
+            if log_entry is _LOG_STOP:
+                continue
+            if f:
+                try:
+                    f.write(_encode_log_entry(log_entry))
+                except Exception as e:
+                    logging.error(f"Failed to write to log file: {e}")
+            else:
+                _write_log_entry(log_entry)
+        if f:
+            _close_log_file(f)
+
+
+@app.on_event("startup")
+async def start_log_consumer():
+    global log_queue, log_consumer_task
+    log_queue = asyncio.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+    log_consumer_task = asyncio.create_task(_log_consumer())
+
+
+@app.on_event("shutdown")
+async def stop_log_consumer():
+    global log_queue, log_consumer_task
+    if log_consumer_task:
+        await log_queue.put(_LOG_STOP)
+        await log_consumer_task
+        # Anything logged after this point is written synchronously
+        log_queue, log_consumer_task = None, None
+
 
 def log_message(user_id, message, request: Request, is_user=True, response=None, error=None, language="en"):
-    """Save chat logs with language"""
-    timestamp = datetime.now().isoformat()
+    """Queue chat logs with language (non-blocking). timestamp is epoch nanoseconds."""
     log_entry = {
-        "timestamp": timestamp,
+        "timestamp": time.time_ns(),
         "user_id": user_id,
         "message_type": "user" if is_user else "ai",
         "message": message,
@@ -51,23 +184,33 @@ def log_message(user_id, message, request: Request, is_user=True, response=None,
         "ip_address": request.client.host if request.client else "Unknown",
         "user_agent": request.headers.get("user-agent", "Unknown"),
     }
-    log_file = logs_dir / f"chat_logs_{datetime.now().strftime('%Y-%m-%d')}.json"
-    try:
-        if log_file.exists():
-            with open(log_file, "r", encoding="utf-8") as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        logs.append(log_entry)
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(logs, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logging.error(f"Failed to write to log file: {e}")
+    if log_queue is None:
+        _write_log_entry(log_entry)
+    else:
+        try:
+            log_queue.put_nowait(log_entry)
+        except asyncio.QueueFull:
+            # Drop the oldest entry rather than block the request
+            log_queue.get_nowait()
+            log_queue.put_nowait(log_entry)
 
     if is_user:
         logging.info(f"[{language.upper()}] User {user_id} ({log_entry['ip_address']}): {message}")
+    elif error:
+        logging.info(f"[{language.upper()}] AI Error for {user_id}: {error}")
     else:
-        logging.info(f"[{language.upper()}] AI Response to {user_id}: {response[:100]}...")
+        logging.info(f"[{language.upper()}] AI Response to {user_id}: {(response or '')[:100]}...")
+
+
+def iter_logs(day: str):
+    """Yield log entries for a given day (YYYY-MM-DD) one line at a time; memory stays O(1)"""
+    log_file = _log_file_for(day)
+    if not log_file.exists():
+        return
+    with open(log_file, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
 
 
 def get_user_id(session_id: str = None):
@@ -76,10 +219,105 @@ def get_user_id(session_id: str = None):
     return session_id
 
 
+def wants_event_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def sse_event(payload: dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def sse_replay(reply: dict):
+    """Send an already-complete reply as SSE: one delta, then the closing event"""
+    yield sse_event({"delta": reply["response"]})
+    yield sse_event({"done": True, **{k: v for k, v in reply.items() if k != "response"}})
+
+
+def cached_response(user_id, message, request: Request, language, cached):
+    """Build the /api/chat reply for an answer served from the RAG answer cache"""
+    refined_query, _context, ai_response, _doc_ids = cached
+    log_message(user_id, message, request, is_user=False, response=ai_response, language=language)
+    reply = {
+        "response": ai_response,
+        "success": True,
+        "refined_query": refined_query,
+        "session_id": user_id,
+        "language": language,
+        "cached": True,
+    }
+    if wants_event_stream(request):
+        return StreamingResponse(sse_replay(reply), media_type="text/event-stream")
+    return reply
+
+
+async def stream_answer(prompt, user_id, message, request: Request, language, refined_query,
+                        relevant_context, doc_ids, query_embedding):
+    """Forward Gemini chunks as SSE `delta` events; log + cache the full answer at the end"""
+    parts = []
+    try:
+        response = await answer_model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            parts.append(chunk.text)
+            yield sse_event({"delta": chunk.text})
+    except Exception as e:
+        error_msg = f"Failed to get AI response: {str(e)}"
+        log_message(user_id, message, request, is_user=False, error=error_msg, language=language)
+        print(f"Error: {str(e)}")
+        yield sse_event({"done": True, "error": error_msg, "success": False})
+        return
+
+    ai_response = "".join(parts).strip()
+    if query_embedding is not None:
+        rag_system.cache_answer(message, language, query_embedding,
+                                (refined_query, relevant_context, ai_response, doc_ids))
+    log_message(user_id, message, request, is_user=False, response=ai_response, language=language)
+    yield sse_event({
+        "done": True,
+        "success": True,
+        "refined_query": refined_query,
+        "session_id": user_id,
+        "language": language,
+    })
+
+
+@lru_cache(maxsize=16)
+def answer_prompt_prefix(brand_name: str, language: str) -> str:
+    """
+    Static part of the final-answer prompt, built once per (brand, language).
+    It leads the prompt so every request shares an identical prefix and only
+    the question + retrieved context vary.
+    """
+    if language == "hi":
+        lang_instruction = (
+            "\n- Answer **in Hindi language only**.\n"
+            "- Keep respectful tone, short 2–5 sentences.\n"
+            "- Use bullet points with suitable emojis.\n"
+        )
+    else:
+        lang_instruction = (
+            "\n- Answer in English.\n"
+            "- Respectful tone, short 2–5 sentences.\n"
+            "- Use bullet points with emojis.\n"
+        )
+
+    return f"""
+You are a precise FAQ assistant for the brand {brand_name}.
+
+INSTRUCTIONS:
+{lang_instruction}
+- Answer the question in <USER_QUESTION> using the <DETAILED_CONTEXT> below.
+- If the context has a clearly written answer, return it verbatim (but formatted and pointwise when required).
+- If no relevant answer exists, say politely: "🙏 Sorry, I don’t have that information right now."
+"""
+
+
 # Configure Gemini
 api_key = os.getenv("GEMINI_API_KEY")
+answer_model = None
 if api_key:
     genai.configure(api_key=api_key)
+    # Shared by every request; the async methods keep the event loop free
+    answer_model = genai.GenerativeModel("gemini-1.5-flash")
 
 # ------------------ Init RAG ------------------
 rag_system = None
@@ -97,9 +335,9 @@ async def chat(
     session_id: str = Header(default=None),
     x_language: str = Header(default="en"),   # 👈 NEW
 ):
-    """Main chat endpoint"""
+    """Main chat endpoint. Streams the answer as SSE when the client sends `Accept: text/event-stream`."""
     try:
-        data = await request.json()
+        data = orjson.loads(await request.body())
         message = data.get("message", "")
 
         if not message:
@@ -118,50 +356,40 @@ async def chat(
             log_message(user_id, message, request, is_user=False, error=error_msg, language=x_language)
             return {"error": error_msg, "success": False}
 
-        personal_info = rag_system.get_personal_info()
-        profile_summary = rag_system.get_summary_document()
+        cached = rag_system.get_cached_answer(message, x_language)
+        if cached:
+            return cached_response(user_id, message, request, x_language, cached)
 
-        # ---------------- Query Refinement ----------------
-        query_refiner_prompt = f"""
-Refine the user question into a precise search query.
+        personal_info = rag_system.get_personal_info()
 
-User's Original Question: "{message}"
-Refined Search Query:
-"""
-        try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            query_refiner_response = model.generate_content(query_refiner_prompt)
-            refined_query = query_refiner_response.text.strip()
-            print(f"🧠 Refined Search Query: {refined_query}")
-        except Exception as e:
-            print(f"⚠️ Query refinement failed: {e}")
-            refined_query = message
+        # ---------------- Query ----------------
+        # No LLM refinement round trip: short FAQ questions embed well as-is,
+        # and MMR retrieval over the KB is robust to the raw wording.
+        refined_query = message
 
         # ---------------- Retrieve Context ----------------
+        query_embedding = None
         try:
-            relevant_context = rag_system.search_relevant_context(refined_query, k=4)
+            # Query embedding + FAISS search are blocking; run them off the event loop
+            query_embedding = await asyncio.to_thread(rag_system.embed_query, refined_query)
+            doc_ids, relevant_context = await asyncio.to_thread(
+                rag_system.retrieve, refined_query, 4, query_embedding
+            )
             print("Retrieved relevant context.")
+
+            cached = rag_system.get_semantic_cached_answer(query_embedding, x_language, doc_ids)
+            if cached:
+                cached = (refined_query, relevant_context, cached[2], doc_ids)
+                rag_system.cache_answer(message, x_language, None, cached)
+                return cached_response(user_id, message, request, x_language, cached)
         except Exception as e:
             print(f"⚠️ RAG search failed: {e}")
             relevant_context = "Unable to retrieve relevant information."
+            query_embedding = None
+            doc_ids = ()
 
         # ---------------- Final Answer ----------------
-        if x_language.lower() == "hi":
-            lang_instruction = (
-                "\n- Answer **in Hindi language only**.\n"
-                "- Keep respectful tone, short 2–5 sentences.\n"
-                "- Use bullet points with suitable emojis.\n"
-            )
-        else:
-            lang_instruction = (
-                "\n- Answer in English.\n"
-                "- Respectful tone, short 2–5 sentences.\n"
-                "- Use bullet points with emojis.\n"
-            )
-
-        final_answer_prompt = f"""
-You are a precise FAQ assistant for the brand {personal_info['name']}.
-
+        final_answer_prompt = answer_prompt_prefix(personal_info["name"], x_language.lower()) + f"""
 <USER_QUESTION>
 {message}
 </USER_QUESTION>
@@ -169,17 +397,22 @@ You are a precise FAQ assistant for the brand {personal_info['name']}.
 <DETAILED_CONTEXT>
 {relevant_context}
 </DETAILED_CONTEXT>
-
-INSTRUCTIONS:
-{lang_instruction}
-- If the context has a clearly written answer, return it verbatim (but formatted and pointwise when required).
-- If no relevant answer exists, say politely: "🙏 Sorry, I don’t have that information right now."
 """
 
-        final_model = genai.GenerativeModel("gemini-1.5-flash")
-        final_response = final_model.generate_content(final_answer_prompt)
+        if wants_event_stream(request):
+            return StreamingResponse(
+                stream_answer(final_answer_prompt, user_id, message, request, x_language,
+                              refined_query, relevant_context, doc_ids, query_embedding),
+                media_type="text/event-stream",
+            )
+
+        final_response = await answer_model.generate_content_async(final_answer_prompt)
         ai_response = final_response.text.strip()
 
+        if query_embedding is not None:
+            rag_system.cache_answer(message, x_language, query_embedding,
+                                    (refined_query, relevant_context, ai_response, doc_ids))
+
         log_message(user_id, message, request, is_user=False, response=ai_response, language=x_language)
 
         return {
@@ -219,8 +452,9 @@ async def rebuild_vectorstore():
         if not api_key:
             return {"error": "Gemini API key not configured", "success": False}
         global rag_system
+        RAGSystem.clear_brand_cache()
         rag_system = RAGSystem(api_key)
-        rag_system.build_vectorstore(use_scraped=True)
+        rag_system.build_vectorstore(use_scraped=True, force=True)
         return {"message": "Vector database rebuilt", "success": True}
     except Exception as e:
         print(f"Error rebuilding vectorstore: {str(e)}")
@@ -232,4 +466,7 @@ if __name__ == "__main__":
     print(f"📡 API Key Status: {'✅ Configured' if api_key else '❌ Not configured'}")
     print(f"🧠 RAG System: {'✅ Ready' if rag_system else '❌ Not ready'}")
     print("🌐 Server running at: http://localhost:5001")
+    # Dev server. In production run multiple workers, e.g.
+    #   uvicorn app:app --host 0.0.0.0 --port 5001 --workers 4 --loop uvloop --http httptools
+    # (uvicorn[standard] installs uvloop + httptools; "auto" picks them up when available)
     uvicorn.run("app:app", host="0.0.0.0", port=5001, reload=True)
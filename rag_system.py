@@ -1,26 +1,112 @@
 # rag_system.py
+import hashlib
+import io
 import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 
-import chromadb
-from chromadb.config import Settings
+import numpy as np
+import orjson
+
+import faiss
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
+# Built once at import and shared by every RAGSystem (and scripts/ingest.py)
+TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=150,
+    length_function=len,
+    separators=["\n\n", "\n", ".", "!", "?", ";", "•", "—", "- "]
+)
+
+# Texts per embed_documents() call during ingestion
+EMBED_BATCH_SIZE = 100
+
+# FAISS retrieval: MMR candidate pool size and IVF cells probed per query
+FETCH_K = 25
+IVF_NPROBE = 8
+
+# Same output as json.dumps(obj, indent=2), without building a new encoder per call
+_encode_pretty = json.JSONEncoder(indent=2).encode
+
+# Answer cache: exact-match LRU on the normalized message, plus a semantic
+# tier matching recent query embeddings by cosine similarity
+ANSWER_CACHE_SIZE = 1024
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# (refined_query, context, response, retrieved doc ids)
+CachedAnswer = Tuple[str, str, str, Tuple[int, ...]]
+
+
+@lru_cache(maxsize=8)
+def _read_brand_json(path: str, mtime_ns: int) -> Dict[str, Any]:
+    """Parsed brand JSON, memoized per (path, mtime) so unchanged files are parsed once"""
+    return orjson.loads(Path(path).read_bytes())
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    """Write to a temp file and rename over `path`, so readers never see a partial file"""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Symmetric int8 quantization with one global scale: q = round(v * 127 / scale)"""
+    scale = float(np.abs(vectors).max()) or 1.0
+    return np.round(vectors * (127.0 / scale)).astype(np.int8), scale
+
+
+def dequantize_int8(quantized: np.ndarray, scale: float) -> np.ndarray:
+    """Back to unit-normalized float32 rows"""
+    vectors = quantized.astype(np.float32) * (scale / 127.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def maximal_marginal_relevance(query_embedding: np.ndarray, embeddings: np.ndarray,
+                               lambda_mult: float = 0.5, k: int = 4) -> List[int]:
+    """
+    Vectorized MMR over unit-normalized embeddings.
+    Returns indices into `embeddings` in selection order.
+    """
+    n = min(k, len(embeddings))
+    if n <= 0:
+        return []
+
+    sims_q = embeddings @ query_embedding
+    sims_cc = embeddings @ embeddings.T
+
+    selected = [int(np.argmax(sims_q))]
+    # Highest similarity of each candidate to anything already selected
+    redundancy = sims_cc[:, selected[0]].copy()
+    while len(selected) < n:
+        scores = lambda_mult * sims_q - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, sims_cc[:, best], out=redundancy)
+    return selected
+
 
 class RAGSystem:
-    def __init__(self, gemini_api_key: str, collection_name: str = "brand_kb"):
+    def __init__(self, gemini_api_key: str, collection_name: str = "brand_kb", index_dir: str = "./faiss_index"):
         """
-        RAG system for brand & product knowledge (Gemini + Chroma).
+        RAG system for brand & product knowledge (Gemini + FAISS).
 
         Args:
             gemini_api_key: Google AI Studio (Gemini) API key
-            collection_name: ChromaDB collection name
+            collection_name: Name of the persisted FAISS index
+            index_dir: Directory holding the persisted index files
         """
         if not gemini_api_key:
             raise ValueError("Gemini API key is required")
@@ -34,24 +120,26 @@ class RAGSystem:
             google_api_key=gemini_api_key
         )
 
-        # ChromaDB persistent client
-        self.chroma_client = chromadb.PersistentClient(
-            path="./chroma_db",
-            settings=Settings(anonymized_telemetry=False)
-        )
+        # Persisted FAISS index + document store
+        self.index_dir = Path(index_dir)
 
-        # Text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=150,
-            length_function=len,
-            separators=["\n\n", "\n", ".", "!", "?", ";", "•", "—", "- "]
-        )
+        # Text splitter (shared, stateless)
+        self.text_splitter = TEXT_SPLITTER
 
-        self.vectorstore = None
+        self.vectorstore = None  # faiss.Index over unit-normalized document embeddings
+        self._doc_texts: List[str] = []
+        self._doc_metadatas: List[Dict[str, Any]] = []
+        # int8 copy of the document embeddings (see quantize_int8), kept only for PQ
+        # indexes; SQ8 indexes reconstruct MMR candidates from their own codes
+        self._doc_embeddings: Optional[np.ndarray] = None
+        self._embedding_scale = 1.0
         self.profile_summary = ""  # Cached summary for app.py
         self.data_cache: Dict[str, Any] = {}
 
+        self._answer_cache: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        # language -> (unit query embeddings, answers), oldest first
+        self._semantic_cache: Dict[str, Tuple[np.ndarray, List[CachedAnswer]]] = {}
+
     # ---------------- Brand JSON Loader ----------------
 
     def _brand_json_path(self, json_path: Optional[str] = None) -> Path:
@@ -64,8 +152,7 @@ class RAGSystem:
         if not path.exists():
             raise FileNotFoundError(f"Brand data not found: {path}")
 
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = _read_brand_json(str(path.resolve()), path.stat().st_mtime_ns)
 
         # Minimal validation
         if "brand" not in data or "name" not in data["brand"]:
@@ -77,6 +164,11 @@ class RAGSystem:
         self.data_cache = data
         return data
 
+    @staticmethod
+    def clear_brand_cache():
+        """Drop memoized brand JSON so the next load re-reads the file"""
+        _read_brand_json.cache_clear()
+
     # ---------------- TXT Loader ----------------
 
     def load_scraped_text_data(self, txt_dir: str = "scraped_data") -> List[Document]:
@@ -106,6 +198,8 @@ class RAGSystem:
         name = brand.get("name", "Unknown Brand")
         tagline = brand.get("tagline", "")
         desc = brand.get("description", "")
+        benefits = brand.get("benefits", [])
+        products = data.get("products", [])
 
         parts = [f"Brand Knowledge Base for: {name}"]
         if tagline:
@@ -113,15 +207,13 @@ class RAGSystem:
         if desc:
             parts.append(f"Description: {desc}")
 
-        products = data.get("products", [])
         parts.append(f"Total products/crops: {len(products)}")
         if products:
-            crop_list = ", ".join([p.get("crop", "N/A") for p in products[:12]])
+            crop_list = ", ".join(p.get("crop", "N/A") for p in products[:12])
             if len(products) > 12:
                 crop_list += ", ..."
             parts.append(f"Crops covered: {crop_list}")
 
-        benefits = brand.get("benefits", [])
         if benefits:
             parts.append("Key Benefits:")
             for b in benefits[:8]:
@@ -129,27 +221,174 @@ class RAGSystem:
 
         return "\n".join(parts)
 
+    # ---------------- Persistence ----------------
+
+    def _source_hash(self, json_path: Optional[str] = None, use_scraped: bool = True,
+                     txt_dir: str = "scraped_data") -> str:
+        """sha256 over brand_data.json (+ scraped .txt files) used to detect a stale index"""
+        h = hashlib.sha256(self._brand_json_path(json_path).read_bytes())
+        if use_scraped:
+            for p in sorted(Path(txt_dir).glob("*.txt")):
+                h.update(p.name.encode("utf-8"))
+                h.update(p.read_bytes())
+        return h.hexdigest()
+
+    def _index_paths(self) -> Tuple[Path, Path, Path]:
+        """(faiss index, int8 document embeddings for PQ indexes, document store) files"""
+        base = self.index_dir / self.collection_name
+        return base.with_suffix(".faiss"), base.with_suffix(".npy"), base.with_suffix(".json")
+
+    @staticmethod
+    def _index_factory_string(n_docs: int) -> str:
+        # Exhaustive search is cheapest for a small KB; IVF needs ~39 training points per cell.
+        # SQ8 stores each dimension as one byte (4x smaller than float32).
+        if n_docs >= 10_000:
+            return "IVF256,PQ16"
+        if n_docs >= 64 * 39:
+            return "IVF64,SQ8"
+        return "SQ8"
+
+    @staticmethod
+    def _set_nprobe(index):
+        try:
+            faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+        except RuntimeError:
+            pass  # not an IVF index
+
+    def _candidate_embeddings(self, ids: List[int]) -> np.ndarray:
+        """Unit-normalized float32 embeddings for MMR reranking"""
+        if self._doc_embeddings is not None:
+            return dequantize_int8(self._doc_embeddings[ids], self._embedding_scale)
+        vecs = self.vectorstore.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+        faiss.normalize_L2(vecs)
+        return vecs
+
+    def _load_persisted_vectorstore(self, src_sha: str) -> bool:
+        """Load the persisted index if it was built from the same sources"""
+        index_path, emb_path, store_path = self._index_paths()
+        if not (index_path.exists() and store_path.exists()):
+            return False
+
+        try:
+            store = orjson.loads(store_path.read_bytes())
+            if store.get("src_sha") != src_sha or not store.get("texts"):
+                return False
+
+            index = faiss.read_index(str(index_path))
+            texts, metadatas = store["texts"], store["metadatas"]
+            doc_embeddings = None
+            if store.get("embedding_scale"):
+                doc_embeddings = np.load(emb_path)
+        except (orjson.JSONDecodeError, RuntimeError, ValueError, KeyError, OSError) as e:
+            print(f"⚠️ Persisted vector DB unreadable, rebuilding: {e}")
+            return False
+
+        if not (index.ntotal == len(texts) == len(metadatas)) or (
+                doc_embeddings is not None and len(doc_embeddings) != len(texts)):
+            print("⚠️ Persisted vector DB files are inconsistent, rebuilding")
+            return False
+
+        self._set_nprobe(index)
+        self.vectorstore = index
+        self._doc_embeddings = doc_embeddings
+        self._embedding_scale = store.get("embedding_scale") or 1.0
+        self._doc_texts = texts
+        self._doc_metadatas = metadatas
+        return True
+
+    def index_documents(self, docs: List[Document], src_sha: str):
+        """Embed documents in batches, build the FAISS index and persist it"""
+        if not docs:
+            raise ValueError("No documents to index")
+
+        texts = [d.page_content for d in docs]
+        vecs: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            vecs.extend(self.embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+        xb = np.asarray(vecs, dtype=np.float32)
+        faiss.normalize_L2(xb)  # inner product == cosine similarity
+
+        factory = self._index_factory_string(len(xb))
+        index = faiss.index_factory(xb.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(xb)
+        index.add(xb)
+        self._set_nprobe(index)
+
+        self.vectorstore = index
+        if "PQ" in factory:
+            # PQ16 codes are too coarse to reconstruct for MMR redundancy scores,
+            # so PQ indexes keep a separate int8 copy of the embeddings
+            self._doc_embeddings, self._embedding_scale = quantize_int8(xb)
+        else:
+            self._doc_embeddings, self._embedding_scale = None, 1.0
+            try:
+                faiss.extract_index_ivf(index).make_direct_map()  # IVF needs it for reconstruct
+            except RuntimeError:
+                pass  # not an IVF index
+        self._doc_texts = texts
+        self._doc_metadatas = [d.metadata for d in docs]
+
+        index_path, emb_path, store_path = self._index_paths()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # The .json (with src_sha) marks the set as valid: drop it first, write it last
+        store_path.unlink(missing_ok=True)
+        _atomic_write_bytes(index_path, faiss.serialize_index(index).tobytes())
+        if self._doc_embeddings is not None:
+            emb_buf = io.BytesIO()
+            np.save(emb_buf, self._doc_embeddings)
+            _atomic_write_bytes(emb_path, emb_buf.getvalue())
+        else:
+            emb_path.unlink(missing_ok=True)
+        _atomic_write_bytes(store_path, orjson.dumps({
+            "src_sha": src_sha,
+            "embedding_scale": self._embedding_scale if self._doc_embeddings is not None else None,
+            "texts": self._doc_texts,
+            "metadatas": self._doc_metadatas,
+        }))
+
     # ---------------- Build Vectorstore ----------------
 
-    def build_vectorstore(self, json_path: Optional[str] = None, use_scraped: bool = True):
+    def build_vectorstore(self, json_path: Optional[str] = None, use_scraped: bool = True, force: bool = False):
         """
-        Build vector DB from brand_data.json + scraped text files
+        Build vector DB from brand_data.json + scraped text files.
+        Reuses the persisted index when the sources are unchanged, unless force=True.
         """
-        print("🔧 Building vector DB...")
         data = self.load_brand_data(json_path=json_path)
         self.profile_summary = self._generate_summary_text(data)
 
-        # Create documents from brand_data.json
+        src_sha = self._source_hash(json_path=json_path, use_scraped=use_scraped)
+        if not force and self._load_persisted_vectorstore(src_sha):
+            print("♻️ Sources unchanged, reusing persisted vector DB")
+            return
+
+        print("🔧 Building vector DB...")
+        docs = self._create_documents_from_brand(data)
+
+        # Add scraped text files
+        if use_scraped:
+            try:
+                scraped_docs = self.load_scraped_text_data("scraped_data")
+                docs.extend(scraped_docs)
+                print(f"📄 Added {len(scraped_docs)} scraped text chunks")
+            except Exception as e:
+                print(f"⚠️ Skipping scraped data: {e}")
+
+        self.index_documents(docs, src_sha)
+        print(f"✅ Vector DB built successfully with {len(docs)} docs!")
+
+    def _create_documents_from_brand(self, data: Dict[str, Any]) -> List[Document]:
+        """Create brand, product and FAQ documents from brand_data.json"""
         docs: List[Document] = []
         if "brand" in data:
             docs.append(Document(
-                page_content=json.dumps(data["brand"], indent=2),
+                page_content=_encode_pretty(data["brand"]),
                 metadata={"type": "brand"}
             ))
 
         for p in data.get("products", []):
             docs.append(Document(
-                page_content=json.dumps(p, indent=2),
+                page_content=_encode_pretty(p),
                 metadata={"type": "product"}
             ))
 
@@ -159,50 +398,102 @@ class RAGSystem:
                 metadata={"type": "faq"}
             ))
 
-        # Add scraped text files
-        if use_scraped:
-            try:
-                scraped_docs = self.load_scraped_text_data("scraped_data")
-                docs.extend(scraped_docs)
-                print(f"📄 Added {len(scraped_docs)} scraped text chunks")
-            except Exception as e:
-                print(f"⚠️ Skipping scraped data: {e}")
-
-        # Build Chroma
-        self.vectorstore = Chroma.from_documents(
-            documents=docs,
-            embedding=self.embeddings,
-            collection_name=self.collection_name,
-            client=self.chroma_client
-        )
-        print("✅ Vector DB built successfully!")
+        return docs
 
     # ---------------- Retrieval ----------------
 
     def get_summary_document(self) -> str:
         return self.profile_summary
 
-    def search_relevant_context(self, query: str, k: int = 5) -> str:
-        if not self.vectorstore:
+    def embed_query(self, query: str) -> np.ndarray:
+        """Unit-normalized query embedding (float32)"""
+        vec = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def search_relevant_context(self, query: str, k: int = 5, query_embedding: Optional[np.ndarray] = None) -> str:
+        return self.retrieve(query, k=k, query_embedding=query_embedding)[1]
+
+    def retrieve(self, query: str, k: int = 5,
+                 query_embedding: Optional[np.ndarray] = None) -> Tuple[Tuple[int, ...], str]:
+        """(ids of the retrieved documents, formatted context)"""
+        if self.vectorstore is None:
             raise ValueError("Vector DB not built. Call build_vectorstore() first.")
 
-        retriever = self.vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={'k': k, 'fetch_k': 25, 'lambda_mult': 0.25}
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        # FAISS candidate search, then MMR rerank over the candidates
+        _, ids = self.vectorstore.search(query_embedding[np.newaxis, :], FETCH_K)
+        candidates = [int(i) for i in ids[0] if i >= 0]
+        selected = maximal_marginal_relevance(
+            query_embedding, self._candidate_embeddings(candidates), lambda_mult=0.25, k=k
         )
-        docs = retriever.get_relevant_documents(query)
+        doc_ids = [candidates[j] for j in selected]
 
-        unique_docs = []
-        seen = set()
-        for d in docs:
-            if d.page_content not in seen:
-                unique_docs.append(d)
-                seen.add(d.page_content)
+        unique_ids = []
+        seen: Set[int] = set()
+        for doc_id in doc_ids:
+            key = hash(self._doc_texts[doc_id])
+            if key not in seen:
+                unique_ids.append(doc_id)
+                seen.add(key)
 
         ctx_parts = []
-        for i, d in enumerate(unique_docs, 1):
-            ctx_parts.append(f"Context {i}:\n{d.page_content}")
-        return "\n\n".join(ctx_parts)
+        for i, doc_id in enumerate(unique_ids, 1):
+            ctx_parts.append(f"Context {i}:\n{self._doc_texts[doc_id]}")
+        return tuple(unique_ids), "\n\n".join(ctx_parts)
+
+    # ---------------- Answer Cache ----------------
+
+    @staticmethod
+    def _answer_cache_key(message: str, language: str) -> Tuple[str, str]:
+        return message.strip().lower(), language.lower()
+
+    def get_cached_answer(self, message: str, language: str) -> Optional[CachedAnswer]:
+        key = self._answer_cache_key(message, language)
+        cached = self._answer_cache.get(key)
+        if cached is not None:
+            self._answer_cache.move_to_end(key)
+        return cached
+
+    def get_semantic_cached_answer(self, query_embedding: np.ndarray, language: str,
+                                   doc_ids: Tuple[int, ...]) -> Optional[CachedAnswer]:
+        """
+        Reuse the answer to a near-identical earlier question. A similar embedding
+        alone is not enough (e.g. "dose for wheat" vs "dose for paddy"), so the
+        cached entry must also have retrieved the same documents as this query.
+        """
+        entry = self._semantic_cache.get(language.lower())
+        if entry is None:
+            return None
+        vecs, answers = entry
+        sims = vecs @ query_embedding
+        for i in np.argsort(-sims):
+            if sims[i] < SEMANTIC_CACHE_THRESHOLD:
+                break
+            if answers[i][3] == doc_ids:
+                return answers[i]
+        return None
+
+    def cache_answer(self, message: str, language: str, query_embedding: Optional[np.ndarray],
+                     answer: CachedAnswer):
+        key = self._answer_cache_key(message, language)
+        self._answer_cache[key] = answer
+        self._answer_cache.move_to_end(key)
+        if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+            self._answer_cache.popitem(last=False)
+
+        if query_embedding is None:
+            return
+        lang = language.lower()
+        if lang in self._semantic_cache:
+            vecs, answers = self._semantic_cache[lang]
+            vecs = np.vstack([vecs, query_embedding])[-SEMANTIC_CACHE_SIZE:]
+            answers = (answers + [answer])[-SEMANTIC_CACHE_SIZE:]
+        else:
+            vecs, answers = query_embedding[np.newaxis, :], [answer]
+        self._semantic_cache[lang] = (vecs, answers)
 
     # ---------------- Backward compatibility ----------------
 
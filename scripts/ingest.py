@@ -1,17 +1,15 @@
 # scripts/ingest.py
 
 import os
+import sys
 import json
 import shutil
 from pathlib import Path
 
-import chromadb
-from chromadb.config import Settings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import orjson
+
 from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
 from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 
 # ------------------ CONFIG ------------------
@@ -19,7 +17,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent   # backend/ root
 DATA_DIR = BASE_DIR / "scraped_data"
 PDF_DIR = BASE_DIR / "pdfs"
 BRAND_JSON = BASE_DIR / "brand_data.json"
-CHROMA_DIR = BASE_DIR / "chroma_db"
+INDEX_DIR = BASE_DIR / "faiss_index"
+
+sys.path.insert(0, str(BASE_DIR))
+from rag_system import RAGSystem, TEXT_SPLITTER  # noqa: E402
 
 # Load API key
 load_dotenv()
@@ -27,27 +28,16 @@ api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise ValueError("❌ GEMINI_API_KEY not found in .env file")
 
-# Gemini embeddings
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
-    google_api_key=api_key
-)
-
 # Text splitter
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=150,
-    length_function=len,
-    separators=["\n\n", "\n", ".", "!", "?", ";", "•", "—", "- "]
-)
+splitter = TEXT_SPLITTER
 
 # ------------------ UTILS ------------------
-def clean_chroma():
-    """Delete old chroma_db folder."""
-    if CHROMA_DIR.exists():
-        shutil.rmtree(CHROMA_DIR)
-        print("🗑️ Old chroma_db deleted")
-    CHROMA_DIR.mkdir(exist_ok=True)
+def clean_index():
+    """Delete old faiss_index folder."""
+    if INDEX_DIR.exists():
+        shutil.rmtree(INDEX_DIR)
+        print("🗑️ Old faiss_index deleted")
+    INDEX_DIR.mkdir(exist_ok=True)
 
 def load_brand_data() -> list[Document]:
     """Load brand_data.json into documents."""
@@ -55,8 +45,7 @@ def load_brand_data() -> list[Document]:
         print("⚠️ brand_data.json not found, skipping...")
         return []
 
-    with open(BRAND_JSON, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = orjson.loads(BRAND_JSON.read_bytes())
 
     docs = []
     if "brand" in data:
@@ -124,7 +113,7 @@ def deduplicate(docs: list[Document]) -> list[Document]:
 # ------------------ MAIN ------------------
 def main():
     print("🚀 Starting ingestion pipeline...")
-    clean_chroma()
+    clean_index()
 
     docs = []
     docs.extend(load_brand_data())
@@ -137,14 +126,11 @@ def main():
         print("❌ No documents to index. Exiting.")
         return
 
-    Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        collection_name="brand_kb",
-        client=chromadb.PersistentClient(path=str(CHROMA_DIR), settings=Settings(anonymized_telemetry=False))
-    )
+    # Tag the index with the app's source hash so app.py reuses it on startup
+    rag = RAGSystem(api_key, collection_name="brand_kb", index_dir=str(INDEX_DIR))
+    rag.index_documents(docs, rag._source_hash(json_path=str(BRAND_JSON), txt_dir=str(DATA_DIR)))
 
-    print(f"🎉 Vector DB built successfully with {len(docs)} docs in {CHROMA_DIR}/")
+    print(f"🎉 Vector DB built successfully with {len(docs)} docs in {INDEX_DIR}/")
 
 if __name__ == "__main__":
     main()